@@ -8,6 +8,15 @@ from datetime import datetime
 import sys
 import importlib
 import inspect
+import functools
+import json
+import math
+import re
+
+try:
+    from yaml import CSafeLoader as _SafeLoader, CSafeDumper as _SafeDumper
+except ImportError:
+    from yaml import SafeLoader as _SafeLoader, SafeDumper as _SafeDumper
 
 _TYPE_MAPPINGS = {
     int: "Integer",
@@ -27,11 +36,29 @@ _TYPE_MAPPINGS = {
     type(None): "NoneType",
 }
 
+_DICT_TYPES = (dict, omegaconf.DictConfig)
+
+# Write saved configs with the restricted YAML writer below instead of PyYAML's dumper
+FAST_YAML_DUMP = True
+# Strings that can be written unquoted: no indicator characters, cannot start like a number/sequence,
+# no leading/trailing spaces. Leading dots are allowed unless they would read as a float (.5, .inf, ...).
+_YAML_PLAIN_STR = re.compile(r"(?!\.[0-9_])[A-Za-z_./](?:[A-Za-z0-9_./\- ]*[A-Za-z0-9_./\-])?")
+# Plain words YAML 1.1 would not load back as strings
+_YAML_RESERVED_WORDS = {"y", "n", "yes", "no", "true", "false", "on", "off", "null", ".inf", ".nan"}
+
 
 def get_cli_type_string(obj_type):
     return _TYPE_MAPPINGS.get(obj_type, None)
 
 
+def _cached_import(name: str):
+    """Import a module, returning it straight from `sys.modules` if already loaded."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return importlib.import_module(name)
+
+
 def vassert(cond: bool, err_msg: str):
     """Assertion util; raise a ValueError if the condition is not met
 
@@ -57,18 +84,52 @@ def flatten_dict(d: dict, sep="/"):
         dict: Flat dictionary, with keys corresponding to the nesting structure.
     """
     out_dict = dict()
-
-    for k, v in d.items():
-        if isinstance(v, dict) or isinstance(v, omegaconf.dictconfig.DictConfig):
-            sub_flat = flatten_dict(v, sep)
-            sub_flat = {f"{k}{sep}{sub_k}": v for sub_k, v in sub_flat.items()}
-            out_dict.update(sub_flat)
+    # Stack of (prefix, items iterator); resuming iterators keeps the key order of `d`
+    stack = [(None, iter(d.items()))]
+
+    while stack:
+        prefix, items = stack[-1]
+        for k, v in items:
+            key = k if prefix is None else f"{prefix}{sep}{k}"
+            if isinstance(v, _DICT_TYPES):
+                stack.append((key, iter(v.items())))
+                break
+            out_dict[key] = v
         else:
-            out_dict[k] = v
+            stack.pop()
 
     return out_dict
 
 
+@functools.lru_cache(maxsize=4096)
+def _split_key(key: str, sep: str):
+    """Split a flat key once; the same dotted keys are split again on every `parse_args` call."""
+    return tuple(key.split(sep))
+
+
+def _same_after_round_trip(d: dict, sep="/"):
+    """Whether the loaded YAML `d` is unchanged by `unflatten_dict(flatten_dict(...))`: string keys without `sep`,
+    no empty nested dictionary (no flat key, dropped) and no interpolation (resolved when flattening).
+    """
+    if not isinstance(d, dict):
+        return False
+    stack = [d]
+    while stack:
+        cur = stack.pop()
+        if isinstance(cur, dict):
+            if len(cur) == 0 and cur is not d:
+                return False
+            for k, v in cur.items():
+                if not isinstance(k, str) or sep in k:
+                    return False
+                stack.append(v)
+        elif isinstance(cur, list):
+            stack.extend(cur)
+        elif isinstance(cur, str) and "${" in cur:
+            return False
+    return True
+
+
 def unflatten_dict(d: dict, sep="/"):
     """Reverse `flatten_dict` operation.
 
@@ -81,19 +142,12 @@ def unflatten_dict(d: dict, sep="/"):
     """
     out_dict = dict()
 
-    def insert_rec(root, key, value):
-        if len(key) == 1:
-            k = key[0]
-            root[k] = value
-        else:
-            k = key[0]
-            rest = key[1:]
-            if k not in root:
-                root[k] = dict()
-            insert_rec(root[k], rest, value)
-
     for k, v in d.items():
-        insert_rec(out_dict, k.split(sep), v)
+        parts = _split_key(k, sep)
+        root = out_dict
+        for p in parts[:-1]:
+            root = root.setdefault(p, dict())
+        root[parts[-1]] = v
 
     return out_dict
 
@@ -136,6 +190,45 @@ def default_arguments():
     )
 
 
+def _add_store_action(parser: argparse.ArgumentParser, option_string: str, default, parse_type, help: str):
+    """Same as `parser.add_argument(option_string, default=default, type=parse_type, help=help)` for a `--key` option,
+    but registers the store action directly instead of going through argparse's generic argument resolution.
+    Falls back to `add_argument` on conflicts, subclassed parsers/groups and custom registered action or type classes.
+    """
+    # Same dest as argparse derives from a long option string
+    dest = option_string.lstrip(parser.prefix_chars).replace("-", "_")
+    if type(parser) is argparse.ArgumentParser:
+        group = parser._optionals
+    elif type(parser) is argparse._ArgumentGroup:
+        # Plain argument groups share the actions and option strings of their parser
+        group = parser
+    else:
+        group = None
+
+    if (
+        group is None
+        or "-" not in parser.prefix_chars
+        or option_string in parser._option_string_actions
+        or parser._registry_get("action", None) is not argparse._StoreAction
+        or parser._registry_get("type", parse_type, parse_type) is not parse_type
+    ):
+        return parser.add_argument(option_string, default=default, type=parse_type, help=help)
+
+    action = argparse._StoreAction(
+        option_strings=[option_string],
+        dest=dest,
+        default=default,
+        type=parse_type,
+        help=help,
+    )
+    # Mirrors `_ArgumentGroup._add_action`: registered on the parser, listed in the group for --help
+    action.container = group
+    parser._actions.append(action)
+    parser._option_string_actions[option_string] = action
+    group._group_actions.append(action)
+    return action
+
+
 def add_args(parser: argparse.ArgumentParser, defaults: dict, prefix: str = ""):
     """Add arguments from a dictionnary of default values to an argparse parser.
 
@@ -144,6 +237,8 @@ def add_args(parser: argparse.ArgumentParser, defaults: dict, prefix: str = ""):
         defaults (dict): Dictionnary containing default values; Used to infer types of parameters in parser.
         prefix (str, optional): Prefix of parameters. For example, if prefix is `test` and `defaults` contains a key `val1`, it will be accessible in the parser/config as `test.val1`. Defaults to "".
     """
+    _tm = _TYPE_MAPPINGS.get
+
     for k, v in defaults.items():
         v_type = type(v)
         if v is None:
@@ -160,14 +255,21 @@ def add_args(parser: argparse.ArgumentParser, defaults: dict, prefix: str = ""):
         else:
             k = "--" + k
 
-        helper_type = get_cli_type_string(help_type)
+        helper_type = _tm(help_type)
         helper_string = f"Default: `{v}`"
         if helper_type is None:
             helper_string += " (Unknown type)"
         else:
             helper_string += f". Type: {helper_type}"
 
-        parser.add_argument(k, default=v, type=parse_type, help=helper_string)
+        _add_store_action(parser, k, v, parse_type, helper_string)
+
+
+def _check_empty_parameters(empty_parameters: list):
+    if len(empty_parameters) > 0:
+        err_message = "The following parameters have no default_values. Please define a default value for the parser to work:\n"
+        err_message += "\n".join("\t* " + v for v in empty_parameters)
+        raise ValueError(err_message)
 
 
 def get_default_from_signature(sig):
@@ -182,16 +284,70 @@ def get_default_from_signature(sig):
         else:
             default_args[k] = v.default
 
-    if len(empty_parameters) > 0:
-        err_message = "The following parameters have no default_values. Please define a default value for the parser to work:\n"
-        err_message += "\n".join("\t* " + v for v in empty_parameters)
-        raise ValueError(err_message)
+    _check_empty_parameters(empty_parameters)
+
+    return default_args
+
+
+@functools.lru_cache(maxsize=256)
+def _sig_of(obj):
+    return inspect.signature(obj)
+
+
+def _is_plain_function(fn):
+    """Whether defaults of `fn` can be read from its code object, without building an `inspect.Signature`.
+    Wrapped callables, custom signatures and *args/**kwargs go through `inspect` to keep its semantics.
+    """
+    return (
+        inspect.isfunction(fn)
+        and not hasattr(fn, "__wrapped__")
+        and not hasattr(fn, "__signature__")
+        and not fn.__code__.co_flags & (inspect.CO_VARARGS | inspect.CO_VARKEYWORDS)
+    )
+
+
+def _fast_defaults(fn):
+    """Same as `get_default_from_signature(inspect.signature(fn))`, for plain python functions."""
+    code = fn.__code__
+    n_args = code.co_argcount
+    names = code.co_varnames[:n_args]
+    kw_names = code.co_varnames[n_args : n_args + code.co_kwonlyargcount]
+    defaults = fn.__defaults__ or ()
+    kw_defaults = fn.__kwdefaults__ or {}
+
+    default_args = dict()
+    empty_parameters = []
+    first_default = n_args - len(defaults)
+
+    for i, k in enumerate(names):
+        if k == "self":
+            continue
+        if i < first_default:
+            empty_parameters.append(k)
+        else:
+            default_args[k] = defaults[i - first_default]
+
+    for k in kw_names:
+        if k == "self":
+            continue
+        if k in kw_defaults:
+            default_args[k] = kw_defaults[k]
+        else:
+            empty_parameters.append(k)
+
+    _check_empty_parameters(empty_parameters)
 
     return default_args
 
 
 def get_default_from_fn(fn):
-    sig = inspect.signature(fn)
+    if _is_plain_function(fn):
+        code = fn.__code__
+        if code.co_argcount + code.co_kwonlyargcount == 0:
+            return fn()  # Assumes that it returns a dictionary containing the parameters
+        return _fast_defaults(fn)
+
+    sig = _sig_of(fn)
     if len(sig.parameters) == 0:
         return fn()  # Assumes that it returns a dictionary containing the parameters
     else:
@@ -199,7 +355,9 @@ def get_default_from_fn(fn):
 
 
 def get_default_from_class(cls):
-    sig = inspect.signature(cls.__init__)
+    if _is_plain_function(cls.__init__):
+        return _fast_defaults(cls.__init__)
+    sig = _sig_of(cls.__init__)
     return get_default_from_signature(sig)
 
 
@@ -225,54 +383,61 @@ def add_module_args(
         prefix (str): Prefix of defaults imported from `attr` (i.e. in what sub field of the config they will be).
         loc (str): Which attribute of the module to take arguments from. Can be a top-level class or function.
     """
-    args = parse_args(parser, parse_known_only=True)
-    module_key = get_args_rec(args, attr)
+    known_only_args, _ = parser.parse_known_args()
+    if known_only_args.cfg_from is None:
+        # argparse keeps dots in `dest`, so dotted attrs can be read directly
+        module_key = getattr(known_only_args, attr, None)
+    else:
+        # The module may be set in the config file, need the full resolution
+        args = parse_args(parser, parse_known_only=True)
+        module_key = get_args_rec(args, attr)
     if module_key is not None:
-        module = importlib.import_module(module_key)
+        module = _cached_import(module_key)
         obj = getattr(module, loc)
         args_to_add = get_default_args(obj)
         add_args(parser, args_to_add, prefix)
 
 
+@functools.lru_cache(maxsize=4)
+def _cli_passed_args_cached(argv: tuple):
+    return frozenset(a[2:] for a in argv if a.startswith("--")) - {"cfg_from"}
+
+
 def get_cli_passed_args():
     """Return actual arguments passed from the command line (as opposed to the ones having default values)
 
     Returns:
-        set: Set of argument names. Assumes they start with --
+        frozenset: Set of argument names. Assumes they start with --
     """
-    arguments = set()
-    for arg in sys.argv[1:]:
-        if arg.startswith("--"):
-            arguments.add(arg[2:])
-
-    arguments -= set(["cfg_from"])
-    return arguments
+    return _cli_passed_args_cached(tuple(sys.argv[1:]))
 
 
-def check_missing_keys(parser: argparse.ArgumentParser, args: dict):
+def check_missing_keys(parser: argparse.ArgumentParser, actual_flat_keys: set):
     """Check whether there are too many or too few parameters. Typically useful when loading a configuration from a yaml file. Use the parser to determine which arguments are required.
 
     Args:
         parser (argparse.ArgumentParser): argparse's parser.
-        args (dict): Actual arguments received by the program.
+        actual_flat_keys (set): Dotted keys of the actual arguments received by the program (e.g. `flatten_dict(args, ".").keys()`). Any container with fast membership tests works.
 
     Raises:
         ValueError: If missing key in args.
         ValueError: If unexpected (additional) key in args.
     """
-    default_expected_args = parser.parse_args([])
-    keys = vars(default_expected_args).keys()
-    actual_keys = flatten_dict(args, ".").keys()
-
-    missing_keys = keys - actual_keys
-    additional_keys = actual_keys - keys
-
+    # Same keys as `vars(parser.parse_args([]))`, without running a parse
+    keys = {
+        a.dest
+        for a in parser._actions
+        if a.dest != argparse.SUPPRESS and a.default is not argparse.SUPPRESS
+    }
+    keys.update(parser._defaults.keys())
+    missing_keys = [k for k in keys if k not in actual_flat_keys]
     if len(missing_keys) > 0:
         err_message = "Missing keys in config:"
         for k in missing_keys:
             err_message += f"\n    * `{k}`"
         raise ValueError(err_message)
 
+    additional_keys = [k for k in actual_flat_keys if k not in keys]
     if len(additional_keys) > 0:
         err_message = "Unknown keys in arguments not required by program:"
         for k in additional_keys:
@@ -293,14 +458,13 @@ def check_workdir(args: OmegaConf):
     script_name, _ = osp.splitext(sys.argv[0])
     now = datetime.now()
     day_str = now.strftime("%d-%m-%Y")
-    time_str = now.strftime("%H:%M:%S")
+    time_str = now.strftime("%H-%M-%S")
     workdir_parent = "./runs"
     workdir = osp.join(workdir_parent, script_name, day_str, time_str)
 
     idx = 2
     while osp.exists(workdir):
-        time_str = now.strftime(f"%H:%M:%S({idx})")
-        workdir = osp.join(workdir_parent, script_name, day_str, time_str)
+        workdir = osp.join(workdir_parent, script_name, day_str, f"{time_str}({idx})")
         idx += 1
 
     args.workdir = workdir
@@ -308,6 +472,26 @@ def check_workdir(args: OmegaConf):
     return args
 
 
+def _peek_cfg_from(parser: argparse.ArgumentParser, args=None):
+    """Cheap scan of the parser defaults and raw arguments for `--cfg_from`, to avoid a `parse_known_args` pass when it is not set.
+    May return false positives (e.g. abbreviations), never false negatives.
+    """
+    if parser.fromfile_prefix_chars is not None:
+        return True
+    if parser._defaults.get("cfg_from") is not None:
+        return True
+    for a in parser._actions:
+        if a.dest == "cfg_from" and a.default is not None:
+            return True
+    for a in sys.argv[1:] if args is None else args:
+        if a.startswith("--cfg_from"):
+            return True
+        opt = a.split("=", 1)[0]
+        if parser.allow_abbrev and len(opt) > 2 and "--cfg_from".startswith(opt):
+            return True
+    return False
+
+
 def parse_args(parser: argparse.ArgumentParser, parse_known_only=False, args=None):
     """Parse args: create OmegaConf dictionnary containing arguments from the parser.
 
@@ -319,13 +503,16 @@ def parse_args(parser: argparse.ArgumentParser, parse_known_only=False, args=Non
     Returns:
         dict: OmegaConf dictionnary (can use dotted notation on it).
     """
-    known_only_args, _ = parser.parse_known_args(args)
-    known_keys = set(vars(known_only_args).keys())
+    known_only_args = None
+    cfg = None
+    if parse_known_only or _peek_cfg_from(parser, args):
+        known_only_args, _ = parser.parse_known_args(args)
 
-    if known_only_args.cfg_from is not None:
+    if known_only_args is not None and known_only_args.cfg_from is not None:
+        known_keys = set(vars(known_only_args).keys())
         # Load config from file if cfg_from defined
         with open(known_only_args.cfg_from, "r") as f:
-            yaml_in = yaml.safe_load(f)
+            yaml_in = yaml.load(f, Loader=_SafeLoader)
 
         yaml_args = OmegaConf.create(yaml_in)
         flat_yaml_args = flatten_dict(yaml_args, sep=".")
@@ -334,6 +521,14 @@ def parse_args(parser: argparse.ArgumentParser, parse_known_only=False, args=Non
             cli_non_default_args = get_cli_passed_args() & known_keys
         else:
             cli_non_default_args = get_cli_passed_args()
+
+        if (
+            not cli_non_default_args
+            and not parse_known_only
+            and _same_after_round_trip(yaml_in, sep=".")
+        ):
+            # Config used as-is: no need to rebuild it from the flat arguments
+            cfg = yaml_args
         # Overwrite config from CLI if provided
         known_only_dict = vars(known_only_args)
         for cli_k in cli_non_default_args:
@@ -345,27 +540,24 @@ def parse_args(parser: argparse.ArgumentParser, parse_known_only=False, args=Non
                 k: v for k, v in flat_yaml_args.items() if k in known_keys
             }
 
-        args = unflatten_dict(flat_yaml_args, sep=".")
-        args = OmegaConf.create(args)
+        flat_args = flat_yaml_args
 
     elif parse_known_only:
         # Parse only known args
-        args = vars(known_only_args)
-        args = unflatten_dict(args, ".")
-        args = OmegaConf.create(args)
+        flat_args = vars(known_only_args)
     else:
         # Parse from command line
-        args = parser.parse_args(args)
-        args = vars(args)
-        args = unflatten_dict(args, ".")
-        args = OmegaConf.create(args)
+        flat_args = vars(parser.parse_args(args))
 
     if not parse_known_only:
-        check_missing_keys(parser, args)
+        check_missing_keys(parser, flat_args.keys())
 
-    if args.workdir is None:
-        args = check_workdir(args)
-    return args
+    if cfg is None:
+        cfg = OmegaConf.create(unflatten_dict(flat_args, "."))
+
+    if not parse_known_only and cfg.workdir is None:
+        cfg = check_workdir(cfg)
+    return cfg
 
 
 def get_parser():
@@ -374,6 +566,61 @@ def get_parser():
     return parser
 
 
+class _UnsupportedYamlValue(ValueError):
+    pass
+
+
+def _yaml_scalar(v):
+    if v is None:
+        return "null"
+    elif isinstance(v, bool):
+        return "true" if v else "false"
+    elif type(v) is int:
+        return str(v)
+    elif type(v) is float:
+        if math.isnan(v):
+            return ".nan"
+        elif math.isinf(v):
+            return ".inf" if v > 0 else "-.inf"
+        r = repr(v)
+        if "." not in r:
+            # YAML 1.1 floats need a dot, e.g. 1e-05 -> 1.0e-05
+            r = r.replace("e", ".0e")
+        return r
+    elif type(v) is str and _YAML_PLAIN_STR.fullmatch(v) and v.lower() not in _YAML_RESERVED_WORDS:
+        return v
+    elif type(v) is str and v.isascii() and v.isprintable():
+        # JSON strings are valid YAML double-quoted scalars
+        return json.dumps(v)
+    elif isinstance(v, (list, tuple)):
+        return "[" + ", ".join(_yaml_scalar(x) for x in v) + "]"
+    else:
+        raise _UnsupportedYamlValue(v)
+
+
+def _dump_yaml(d: dict, indent: int = 0, out: list = None):
+    """Minimal block-style YAML writer for nested dicts of plain scalars, with sorted keys.
+    No anchors, line folding or style heuristics. Raises `_UnsupportedYamlValue` on anything else.
+    """
+    if out is None:
+        out = []
+        if len(d) == 0:
+            return "{}\n"
+    pad = " " * indent
+    if not all(isinstance(k, str) for k in d):
+        raise _UnsupportedYamlValue(d)
+    for k in sorted(d):
+        v = d[k]
+        if isinstance(v, dict) and len(v) > 0:
+            out.append(f"{pad}{_yaml_scalar(k)}:\n")
+            _dump_yaml(v, indent + 2, out)
+        elif isinstance(v, dict):
+            out.append(f"{pad}{_yaml_scalar(k)}: {{}}\n")
+        else:
+            out.append(f"{pad}{_yaml_scalar(k)}: {_yaml_scalar(v)}\n")
+    return "".join(out)
+
+
 def save_args_to_cfg(args: dict):
     """Save arguments to a config file for reproducibility. Use workdir field to find where to save.
 
@@ -381,14 +628,35 @@ def save_args_to_cfg(args: dict):
         args (dict): OmegaConf dict of arguments.
     """
     config_out_path = osp.join(args.workdir, "config.yaml")
-    os.makedirs(args.workdir, exist_ok=True)
+    if not osp.isdir(args.workdir):
+        os.makedirs(args.workdir, exist_ok=True)
+
+    container = OmegaConf.to_container(args, resolve=True, enum_to_str=True)
+    yaml_out = None
+    if FAST_YAML_DUMP:
+        try:
+            yaml_out = _dump_yaml(container)
+        except _UnsupportedYamlValue:
+            pass
+    if yaml_out is None:
+        try:
+            yaml_out = yaml.dump(
+                container,
+                Dumper=_SafeDumper,
+                sort_keys=True,
+                default_flow_style=False,
+                allow_unicode=True,
+            )
+        except yaml.representer.RepresenterError:
+            # Values the safe dumper cannot represent (e.g. pathlib.Path), OmegaConf knows how to write them
+            yaml_out = OmegaConf.to_yaml(args, resolve=True, sort_keys=True)
 
     with open(config_out_path, "w") as f:
-        f.writelines(OmegaConf.to_yaml(args))
+        f.write(yaml_out)
 
 
 def get_args_rec(args: dict, prefix: str, default=None):
-    """Recursively extract an argument from a dictionnary using a dotted key (e.g. top_level.inner.key1).
+    """Extract an argument from a dictionnary using a dotted key (e.g. top_level.inner.key1).
 
     Args:
         args (dict): Dictionnary containing nested dictionnaries.
@@ -398,16 +666,10 @@ def get_args_rec(args: dict, prefix: str, default=None):
     Returns:
         any: Value in nested dictionary. If not found, return `default` argument.
     """
-    ks = prefix.split(".")
-
-    def _rec(ks, args):
-        k = ks[0]
-        tail = ks[1:]
-        if k not in args:
+    cur = args
+    for k in _split_key(prefix, "."):
+        if k not in cur:
             return default
-        elif len(tail) == 0:
-            return args[k]
-        else:
-            return _rec(tail, args[k])
+        cur = cur[k]
 
-    return _rec(ks, args)
+    return cur
@@ -0,0 +1,276 @@
+import argparse
+import enum
+import math
+import sys
+import types
+
+import pytest
+import yaml
+from omegaconf import OmegaConf
+
+from simple_cfg import add_args, add_module_args, get_parser, parse_args, save_args_to_cfg
+from simple_cfg.cfg import _dump_yaml, _UnsupportedYamlValue, check_missing_keys
+
+
+def _round_trip(d):
+    out = _dump_yaml(d)
+    return out, yaml.safe_load(out)
+
+
+def test_dump_yaml_reserved_word_keys():
+    d = {k: 1 for k in ["yes", "No", "on", "OFF", "y", "n", "true", "null", "~", "<<", "="]}
+    _, loaded = _round_trip(d)
+    assert loaded == d
+
+
+def test_dump_yaml_floats():
+    d = dict(a=1e-05, b=1e20, c=-2.5e-10, d=0.5, e=-3.0, f=float("inf"), g=float("-inf"))
+    _, loaded = _round_trip(d)
+    assert loaded == d
+    assert all(type(v) is float for v in loaded.values())
+
+    _, loaded = _round_trip(dict(nan=float("nan")))
+    assert math.isnan(loaded["nan"])
+
+
+def test_dump_yaml_quoted_strings():
+    strings = [
+        "", " lead", "trail ", "123", "1.5", ".5", "._5", ".inf", "1e5", "0x1f", "1:20",
+        "2001-12-14", "true", "Yes", "null", "~", "-x", "x: y", "a #c", "#c", "[a]",
+        "{a}", "a,b", 'a"b', "a\\b", "'q'", "*ref", "&anchor", "!tag", "%d", "@x", "`x",
+    ]
+    for s in strings:
+        d = {"k": s}
+        out, loaded = _round_trip(d)
+        assert loaded == d, (s, out)
+        assert out != f"k: {s}\n", s
+
+
+def test_dump_yaml_plain_strings():
+    d = dict(lib="example_lib", workdir="./runs/example/14-10-2026/11-58-12", arg="Lonely arg")
+    out, loaded = _round_trip(d)
+    assert loaded == d
+    assert out == (
+        "arg: Lonely arg\n"
+        "lib: example_lib\n"
+        "workdir: ./runs/example/14-10-2026/11-58-12\n"
+    )
+
+
+def test_dump_yaml_nested_and_empty_dicts():
+    d = dict(z=dict(b=dict(), a=dict(c=1, inner=dict())), a=None, b=True)
+    out, loaded = _round_trip(d)
+    assert loaded == d
+    assert out.splitlines()[0] == "a: null"
+    assert _round_trip(dict())[1] == dict()
+
+
+def test_dump_yaml_lists():
+    d = dict(a=[], b=[1, "2", None, True, 1e-05], c=[[1, [2]], ["x y", "yes"]], d=(1, 2))
+    _, loaded = _round_trip(d)
+    assert loaded == dict(d, d=[1, 2])
+
+
+def test_dump_yaml_unsupported():
+    for d in [{"a": "é"}, {"a": "x\ny"}, {1: 2}, {"a": [{"b": 1}]}, {"a": object()}]:
+        with pytest.raises(_UnsupportedYamlValue):
+            _dump_yaml(d)
+
+
+class _Color(enum.Enum):
+    RED = 1
+
+
+def test_save_args_to_cfg(tmp_path):
+    workdir = str(tmp_path / "run")
+    args = OmegaConf.create(
+        dict(workdir=workdir, seed=0, sub=dict(name="é", color=_Color.RED, ref="${seed}"))
+    )
+    save_args_to_cfg(args)
+
+    with open(tmp_path / "run" / "config.yaml") as f:
+        loaded = yaml.safe_load(f)
+    assert loaded == dict(workdir=workdir, seed=0, sub=dict(name="é", color="RED", ref=0))
+
+
+def test_add_args_dest_like_add_argument():
+    parser = get_parser()
+    add_args(parser, {"learning-rate": 0.1, "plain": 1}, prefix="opt-x")
+    args = parse_args(parser, args=["--workdir", "w", "--opt-x.learning-rate", "0.5"])
+    assert args.opt_x == {"learning_rate": 0.5, "plain": 1}
+
+
+def test_add_args_to_argument_group():
+    parser = get_parser()
+    group = parser.add_argument_group("g")
+    add_args(group, {"lr": 0.1}, prefix="opt")
+    add_args(parser.add_mutually_exclusive_group(), {"a": 1})
+    args = parse_args(parser, args=["--workdir", "w", "--opt.lr", "0.5"])
+    assert args.opt.lr == 0.5 and args.a == 1
+    assert "--opt.lr" in parser.format_help().split("\ng:\n")[1]
+
+
+def _parse(monkeypatch, parser, argv, **kwargs):
+    # CLI overrides of a loaded config are read from sys.argv
+    monkeypatch.setattr(sys, "argv", ["prog.py", *argv])
+    return parse_args(parser, **kwargs)
+
+
+def _write_cfg(path, cfg):
+    with open(path, "w") as f:
+        yaml.safe_dump(cfg, f)
+    return str(path)
+
+
+def test_parse_args_cfg_from_cli(tmp_path, monkeypatch):
+    cfg_path = _write_cfg(tmp_path / "c.yaml", dict(seed=5, cfg_from=None, workdir="w"))
+    args = _parse(monkeypatch, get_parser(), ["--cfg_from", cfg_path])
+    assert args.seed == 5
+
+    args = _parse(monkeypatch, get_parser(), ["--cfg_from", cfg_path, "--seed", "7"])
+    assert args.seed == 7
+
+
+def test_parse_args_cfg_from_default(tmp_path, monkeypatch):
+    cfg_path = _write_cfg(tmp_path / "c.yaml", dict(seed=5, cfg_from=None, workdir="w"))
+    parser = get_parser()
+    parser.set_defaults(cfg_from=cfg_path)
+    assert _parse(monkeypatch, parser, []).seed == 5
+
+    parser = argparse.ArgumentParser()
+    add_args(parser, dict(seed=0, cfg_from=cfg_path, workdir=None))
+    assert _parse(monkeypatch, parser, []).seed == 5
+
+
+def _sub_parser():
+    parser = get_parser()
+    add_args(parser, dict(a=1, b=2), prefix="sub")
+    return parser
+
+
+def test_parse_args_cfg_from_as_is(tmp_path, monkeypatch):
+    cfg = dict(seed=5, cfg_from=None, workdir="w", sub=dict(a=3, b=4))
+    cfg_path = _write_cfg(tmp_path / "c.yaml", cfg)
+    args = _parse(monkeypatch, _sub_parser(), ["--cfg_from", cfg_path])
+    assert OmegaConf.to_container(args) == cfg
+
+
+def test_parse_args_cfg_from_dotted_keys(tmp_path, monkeypatch):
+    cfg = {"seed": 5, "cfg_from": None, "workdir": "w", "sub.a": 3, "sub": dict(b=4)}
+    cfg_path = _write_cfg(tmp_path / "c.yaml", cfg)
+    args = _parse(monkeypatch, _sub_parser(), ["--cfg_from", cfg_path])
+    assert args.sub == dict(a=3, b=4)
+
+
+def test_parse_args_cfg_from_resolves_interpolations(tmp_path, monkeypatch):
+    cfg = dict(seed=5, cfg_from=None, workdir="w", sub=dict(a="${seed}", b=4))
+    cfg_path = _write_cfg(tmp_path / "c.yaml", cfg)
+    args = _parse(monkeypatch, _sub_parser(), ["--cfg_from", cfg_path])
+    args.seed = 9
+    assert args.sub.a == 5
+
+
+def test_parse_args_cfg_from_drops_empty_dicts(tmp_path, monkeypatch):
+    cfg = dict(seed=5, cfg_from=None, workdir="w", stray=dict())
+    cfg_path = _write_cfg(tmp_path / "c.yaml", cfg)
+    args = _parse(monkeypatch, get_parser(), ["--cfg_from", cfg_path])
+    assert "stray" not in args
+
+
+def test_add_args_respects_parser_customizations():
+    class RecordingParser(argparse.ArgumentParser):
+        def __init__(self, *args, **kwargs):
+            self.calls = []
+            super().__init__(*args, **kwargs)
+
+        def add_argument(self, *args, **kwargs):
+            self.calls.append(args[0])
+            return super().add_argument(*args, **kwargs)
+
+    parser = RecordingParser()
+    add_args(parser, dict(x=1, y=2))
+    assert parser.calls == ["-h", "--x", "--y"]
+
+    class CustomStore(argparse._StoreAction):
+        pass
+
+    parser = argparse.ArgumentParser()
+    parser.register("action", None, CustomStore)
+    add_args(parser, dict(x=1))
+    assert type(parser._option_string_actions["--x"]) is CustomStore
+
+
+def test_parse_args_nested_without_cfg_from():
+    args = parse_args(_sub_parser(), args=["--workdir", "w", "--sub.b", "5"])
+    assert OmegaConf.to_container(args) == dict(
+        seed=0, cfg_from=None, workdir="w", sub=dict(a=1, b=5)
+    )
+
+
+def test_check_missing_keys_flat_keys():
+    parser = _sub_parser()
+    check_missing_keys(parser, {"seed", "cfg_from", "workdir", "sub.a", "sub.b"})
+    with pytest.raises(ValueError, match="Missing keys in config:\n    \\* `sub.b`"):
+        check_missing_keys(parser, {"seed", "cfg_from", "workdir", "sub.a"})
+    with pytest.raises(ValueError, match="Unknown keys .*\n    \\* `sub.c`"):
+        check_missing_keys(parser, {"seed", "cfg_from", "workdir", "sub.a", "sub.b", "sub.c"})
+
+
+def test_check_missing_keys_matches_parse():
+    parser = get_parser()
+    parser.set_defaults(extra=1)
+    parser.add_argument("--hidden", default=argparse.SUPPRESS)
+    args = parse_args(parser, args=["--workdir", "w"])
+    assert args.extra == 1 and "hidden" not in args
+
+
+def test_parse_args_cfg_from_missing_and_unknown_keys(tmp_path, monkeypatch):
+    cfg_path = _write_cfg(tmp_path / "c.yaml", dict(seed=5, cfg_from=None, workdir="w", sub=dict(a=1)))
+    with pytest.raises(ValueError, match="Missing keys"):
+        _parse(monkeypatch, _sub_parser(), ["--cfg_from", cfg_path])
+
+    cfg = dict(seed=5, cfg_from=None, workdir="w", sub=dict(a=1, b=2, c=3))
+    cfg_path = _write_cfg(tmp_path / "c.yaml", cfg)
+    with pytest.raises(ValueError, match="Unknown keys"):
+        _parse(monkeypatch, _sub_parser(), ["--cfg_from", cfg_path, "--sub.a", "4"])
+
+
+def _make_default_args(value):
+    def default_args():
+        return dict(v=value)
+
+    return default_args
+
+
+def _module_parser(monkeypatch):
+    for name, value in [("lib_a", 1), ("lib_b", 2)]:
+        module = types.ModuleType(name)
+        module.default_args = _make_default_args(value)
+        monkeypatch.setitem(sys.modules, name, module)
+    parser = get_parser()
+    add_args(parser, dict(lib="lib_a"))
+    return parser
+
+
+def test_add_module_args(monkeypatch):
+    parser = _module_parser(monkeypatch)
+    monkeypatch.setattr(sys, "argv", ["prog.py", "--lib", "lib_b", "--workdir", "w"])
+    add_module_args(parser, "lib", "sub_lib")
+    assert parse_args(parser).sub_lib.v == 2
+
+
+def test_add_module_args_from_cfg_from(tmp_path, monkeypatch):
+    cfg = dict(seed=0, cfg_from=None, workdir="w", lib="lib_b", sub_lib=dict(v=3))
+    cfg_path = _write_cfg(tmp_path / "c.yaml", cfg)
+    parser = _module_parser(monkeypatch)
+    monkeypatch.setattr(sys, "argv", ["prog.py", "--cfg_from", cfg_path])
+    add_module_args(parser, "lib", "sub_lib")
+    assert parser.parse_args([]).__dict__["sub_lib.v"] == 2
+    assert parse_args(parser).sub_lib.v == 3
+
+
+def test_parse_args_workdir_only_on_full_parse(monkeypatch):
+    monkeypatch.setattr(sys, "argv", ["prog.py"])
+    parser = get_parser()
+    assert parse_args(parser, parse_known_only=True).workdir is None
+    assert parse_args(parser).workdir.startswith("./runs/prog/")